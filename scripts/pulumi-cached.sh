@@ -0,0 +1,24 @@
+#!/usr/bin/env bash
+#
+# Run the Pulumi CLI with PULUMI_HOME pointed at a project-local directory so
+# the azure-native and kubernetes provider plugins downloaded on one run are
+# reused by the next instead of being fetched again.
+#
+# In CI, persist .pulumi-cache/plugins between runs keyed on a hash of the
+# dependency pins (which fix the provider plugin versions), for example:
+#
+#   key: pulumi-plugins-${{ hashFiles('pyproject.toml', 'uv.lock') }}
+#
+# PULUMI_HOME also holds the CLI login state, so run `pulumi login` through
+# this script once (or set PULUMI_ACCESS_TOKEN). An existing PULUMI_HOME is
+# left untouched.
+#
+# Usage: scripts/pulumi-cached.sh <pulumi args...>
+#        make deploy PULUMI=scripts/pulumi-cached.sh
+set -euo pipefail
+
+project_root="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
+export PULUMI_HOME="${PULUMI_HOME:-${project_root}/.pulumi-cache}"
+mkdir -p "${PULUMI_HOME}"
+
+exec pulumi "$@"
@@ -1,6 +1,7 @@
 """
 Module for creating and configuring an Azure Kubernetes Service (AKS) cluster.
 """
+import base64
 from dataclasses import dataclass
 
 import pulumi
@@ -21,8 +22,8 @@ class AksCluster:
 
 
 def create_aks_cluster(
-    resource_group_name: str,
-    location: str,
+    resource_group: resources.ResourceGroup,
+    cluster_name: str,
     kubernetes_version: str,
     node_count: int,
     node_size: str,
@@ -31,8 +32,9 @@ def create_aks_cluster(
     Create an Azure Kubernetes Service (AKS) cluster.
 
     Args:
-        resource_group_name: Name of the resource group
-        location: Azure region to deploy to
+        resource_group: Resource group to create the cluster in; the cluster is
+            placed in the resource group's location
+        cluster_name: Name of the AKS cluster, also used as its DNS prefix
         kubernetes_version: Kubernetes version to use
         node_count: Number of nodes in the default node pool
         node_size: VM size for the nodes
@@ -40,15 +42,7 @@ def create_aks_cluster(
     Returns:
         AksCluster: Object containing the created resources
     """
-    # Create a resource group
-    resource_group = resources.ResourceGroup(
-        resource_group_name,
-        resource_group_name=resource_group_name,
-        location=location,
-    )
-
     # Create AKS cluster
-    cluster_name = f"{resource_group_name}-aks"
     managed_cluster = containerservice.ManagedCluster(
         cluster_name,
         resource_group_name=resource_group.name,
@@ -69,16 +63,28 @@ def create_aks_cluster(
             type="SystemAssigned",
         ),
         enable_rbac=True,
+        # Bound slow AKS provisioning instead of waiting indefinitely
+        opts=pulumi.ResourceOptions(
+            custom_timeouts=pulumi.CustomTimeouts(
+                create="45m", update="30m", delete="30m"
+            ),
+        ),
     )
 
-    # Get the kubeconfig from the created cluster
-    creds = containerservice.get_managed_cluster_admin_credentials_output(
+    # Get the kubeconfig from the created cluster. The *_output form resolves
+    # asynchronously, so registrations in main() do not wait on this lookup.
+    creds = containerservice.list_managed_cluster_admin_credentials_output(
         resource_group_name=resource_group.name,
         resource_name=managed_cluster.name,
+        opts=pulumi.InvokeOptions(parent=managed_cluster),
     )
     
-    # The kubeconfig is the first item in the kubeconfigs array
-    kubeconfig = creds.kubeconfigs[0].value
+    # The kubeconfig is the first item in the kubeconfigs array, base64-encoded.
+    # Decode it for the Kubernetes provider and mark it secret so it is
+    # encrypted in state and in the stack outputs.
+    kubeconfig = pulumi.Output.secret(
+        creds.kubeconfigs[0].value.apply(lambda v: base64.b64decode(v).decode())
+    )
 
     return AksCluster(
         name=managed_cluster.name,
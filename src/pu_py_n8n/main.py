@@ -1,8 +1,20 @@
 """
 Main Pulumi program for deploying n8n to Azure Kubernetes Service.
+
+Resource operations run with Pulumi's default unbounded parallelism unless the
+CLI is given ``--parallel``. The Makefile targets pass ``PULUMI_PARALLEL``
+(default: 4x CPU count, at least 10) to keep peak memory bounded as the stack
+grows; override it with ``make deploy PULUMI_PARALLEL=<n>``.
+
+Provider plugins are cached under ``PULUMI_HOME``; ``scripts/pulumi-cached.sh``
+points it at a project-local ``.pulumi-cache`` directory so repeated runs reuse
+the downloaded plugins. The directory in use is logged at startup.
 """
+import os
+
 import pulumi
 from pulumi import ResourceOptions
+from pulumi_azure_native import resources
 
 from pu_py_n8n.aks_cluster import create_aks_cluster
 from pu_py_n8n.config import N8nConfig
@@ -18,13 +30,24 @@ def main():
     - Azure Kubernetes Service (AKS) Cluster
     - n8n deployment with PostgreSQL database
     """
+    # Report where provider plugins are cached so cache hits can be verified
+    plugin_home = os.environ.get("PULUMI_HOME", os.path.expanduser("~/.pulumi"))
+    pulumi.log.info(f"Pulumi plugin cache: {os.path.join(plugin_home, 'plugins')}")
+
     # Load configuration
     config = N8nConfig()
 
-    # Create AKS cluster
-    aks_cluster = create_aks_cluster(
+    # Create the resource group first so every module can share it
+    resource_group = resources.ResourceGroup(
+        config.resource_group_name,
         resource_group_name=config.resource_group_name,
         location=config.location,
+    )
+
+    # Create AKS cluster
+    aks_cluster = create_aks_cluster(
+        resource_group=resource_group,
+        cluster_name=f"{config.resource_group_name}-aks",
         kubernetes_version=config.kubernetes_version,
         node_count=config.node_count,
         node_size=config.node_size,
@@ -19,6 +19,53 @@ from pulumi_kubernetes.meta.v1 import LabelSelectorArgs, ObjectMetaArgs
 
 from pu_py_n8n.aks_cluster import AksCluster
 
+# Secret names are fixed, so containers reference them directly rather than
+# through the secrets' metadata outputs
+POSTGRES_SECRET_NAME = "postgres-secret"
+N8N_SECRET_NAME = "n8n-secret"
+
+# Container spec fragments shared by every deploy_n8n call
+_POD_RESOURCES = {
+    "limits": {"memory": "500Mi"},
+    "requests": {"memory": "250Mi"},
+}
+_POSTGRES_PORTS = [{"containerPort": 5432}]
+_POSTGRES_VOLUME_MOUNTS = [
+    {"name": "postgres-data", "mountPath": "/var/lib/postgresql/data"}
+]
+_PGBOUNCER_PORTS = [{"containerPort": 6432}]
+_PGBOUNCER_RESOURCES = {
+    "limits": {"memory": "128Mi"},
+    "requests": {"memory": "64Mi"},
+}
+# PgBouncer settings; the upstream credentials are expanded from the postgres
+# secret loaded through envFrom
+_PGBOUNCER_ENV = [
+    {"name": name, "value": value}
+    for name, value in {
+        "DB_PORT": "5432",
+        "DB_NAME": "$(POSTGRES_DB)",
+        "DB_USER": "$(POSTGRES_USER)",
+        "DB_PASSWORD": "$(POSTGRES_PASSWORD)",
+        "AUTH_TYPE": "scram-sha-256",
+        "LISTEN_PORT": "6432",
+        "POOL_MODE": "transaction",
+        "MAX_CLIENT_CONN": "10000",
+        "DEFAULT_POOL_SIZE": "20",
+    }.items()
+]
+_N8N_PORTS = [{"containerPort": 5678}]
+_N8N_VOLUME_MOUNTS = [{"name": "n8n-data", "mountPath": "/home/node/.n8n"}]
+
+
+def _b64encode(value: pulumi.Input[str]) -> pulumi.Input[str]:
+    """
+    Base64-encode a value for a Secret's ``data`` field.
+    """
+    if isinstance(value, pulumi.Output):
+        return value.apply(_b64encode)
+    return base64.b64encode(value.encode()).decode()
+
 
 @dataclass
 class N8nDeployment:
@@ -28,7 +75,10 @@ class N8nDeployment:
 
     postgres_deployment: Deployment
     postgres_service: Service
+    postgres_ro_service: Service
     postgres_pvc: PersistentVolumeClaim
+    pgbouncer_deployment: Deployment
+    pgbouncer_service: Service
     n8n_deployment: Deployment
     n8n_service: Service
     n8n_pvc: PersistentVolumeClaim
@@ -42,7 +92,7 @@ def deploy_n8n(
     n8n_jwt_secret: str,
 ) -> N8nDeployment:
     """
-    Deploy n8n and PostgreSQL to an AKS cluster.
+    Deploy n8n and PostgreSQL, fronted by PgBouncer, to an AKS cluster.
 
     Args:
         aks_cluster: AKS cluster to deploy to
@@ -58,103 +108,84 @@ def deploy_n8n(
         "k8s-provider",
         kubeconfig=aks_cluster.kubeconfig,
     )
-    provider_args = pulumi.ResourceOptions(provider=k8s_provider)
 
-    # Common labels for all resources
-    app_labels = {"app": "n8n"}
+    # Labels shared across resources
+    postgres_labels = {"app": "postgres"}
+    pgbouncer_labels = {"app": "pgbouncer"}
+    n8n_labels = {"app": "n8n"}
 
     # Create namespace for n8n
     namespace = k8s.core.v1.Namespace(
         "n8n-namespace",
         metadata=ObjectMetaArgs(name="n8n"),
-        opts=provider_args,
+        opts=pulumi.ResourceOptions(provider=k8s_provider),
     )
     namespace_name = namespace.metadata["name"]
 
+    # Options shared by every resource in the namespace. Children are parented
+    # to the namespace; the alias keeps the URNs they had as top-level
+    # resources so existing stacks are not replaced.
+    root_opts = pulumi.ResourceOptions(
+        provider=k8s_provider,
+        parent=namespace,
+        aliases=[pulumi.Alias(parent=pulumi.ROOT_STACK_RESOURCE)],
+    )
+
+    def meta(name: str) -> ObjectMetaArgs:
+        return ObjectMetaArgs(name=name, namespace=namespace_name)
+
+    # New claims get an explicit storage class. Claims created before it was
+    # set are bound to the cluster default and storageClassName is immutable,
+    # so ignore it on update rather than replacing (and wiping) them.
+    pvc_opts = pulumi.ResourceOptions.merge(
+        root_opts, pulumi.ResourceOptions(ignore_changes=["spec.storageClassName"])
+    )
+
     # Create PostgreSQL resources
     postgres_secret = Secret(
         "postgres-secret",
-        metadata=ObjectMetaArgs(
-            name="postgres-secret",
-            namespace=namespace_name,
-        ),
-        string_data={
-            "POSTGRES_PASSWORD": postgres_password,
-            "POSTGRES_USER": "postgres",
-            "POSTGRES_DB": "n8n",
+        metadata=meta(POSTGRES_SECRET_NAME),
+        data={
+            key: _b64encode(value)
+            for key, value in {
+                "POSTGRES_PASSWORD": postgres_password,
+                "POSTGRES_USER": "postgres",
+                "POSTGRES_DB": "n8n",
+            }.items()
         },
-        opts=provider_args,
+        opts=root_opts,
     )
 
     postgres_pvc = PersistentVolumeClaim(
         "postgres-pvc",
-        metadata=ObjectMetaArgs(
-            name="postgres-claim0",
-            namespace=namespace_name,
-        ),
+        metadata=meta("postgres-claim0"),
         spec=PersistentVolumeClaimSpecArgs(
             access_modes=["ReadWriteOnce"],
+            storage_class_name="managed-csi",
             resources={"requests": {"storage": "1Gi"}},
         ),
-        opts=provider_args,
+        opts=pvc_opts,
     )
 
     postgres_deployment = Deployment(
         "postgres-deployment",
-        metadata=ObjectMetaArgs(
-            name="postgres",
-            namespace=namespace_name,
-        ),
+        metadata=meta("postgres"),
         spec=DeploymentSpecArgs(
-            selector=LabelSelectorArgs(match_labels={"app": "postgres"}),
+            selector=LabelSelectorArgs(match_labels=postgres_labels),
             replicas=1,
             template={
-                "metadata": {"labels": {"app": "postgres"}},
+                "metadata": {"labels": postgres_labels},
                 "spec": {
                     "containers": [
                         {
                             "name": "postgres",
                             "image": "postgres:14",
-                            "env": [
-                                {
-                                    "name": "POSTGRES_PASSWORD",
-                                    "valueFrom": {
-                                        "secretKeyRef": {
-                                            "name": postgres_secret.metadata["name"],
-                                            "key": "POSTGRES_PASSWORD",
-                                        }
-                                    },
-                                },
-                                {
-                                    "name": "POSTGRES_USER",
-                                    "valueFrom": {
-                                        "secretKeyRef": {
-                                            "name": postgres_secret.metadata["name"],
-                                            "key": "POSTGRES_USER",
-                                        }
-                                    },
-                                },
-                                {
-                                    "name": "POSTGRES_DB",
-                                    "valueFrom": {
-                                        "secretKeyRef": {
-                                            "name": postgres_secret.metadata["name"],
-                                            "key": "POSTGRES_DB",
-                                        }
-                                    },
-                                },
-                            ],
-                            "ports": [{"containerPort": 5432}],
-                            "volumeMounts": [
-                                {
-                                    "name": "postgres-data",
-                                    "mountPath": "/var/lib/postgresql/data",
-                                }
+                            "envFrom": [
+                                {"secretRef": {"name": POSTGRES_SECRET_NAME}}
                             ],
-                            "resources": {
-                                "limits": {"memory": "500Mi"},
-                                "requests": {"memory": "250Mi"},
-                            },
+                            "ports": _POSTGRES_PORTS,
+                            "volumeMounts": _POSTGRES_VOLUME_MOUNTS,
+                            "resources": _POD_RESOURCES,
                         }
                     ],
                     "volumes": [
@@ -166,156 +197,131 @@ def deploy_n8n(
                 },
             },
         ),
-        opts=provider_args,
+        opts=pulumi.ResourceOptions.merge(
+            root_opts, pulumi.ResourceOptions(depends_on=[postgres_secret])
+        ),
     )
 
     postgres_service = Service(
         "postgres-service",
-        metadata=ObjectMetaArgs(
-            name="postgres",
-            namespace=namespace_name,
+        metadata=meta("postgres"),
+        spec=ServiceSpecArgs(
+            selector=postgres_labels,
+            ports=[{"port": 5432}],
         ),
+        opts=root_opts,
+    )
+
+    # Read-only endpoint for a future replica set labelled app=postgres-replica.
+    # It selects no pods until such replicas exist.
+    postgres_ro_service = Service(
+        "postgres-ro-service",
+        metadata=meta("postgres-ro"),
         spec=ServiceSpecArgs(
-            selector={"app": "postgres"},
+            selector={"app": "postgres-replica"},
             ports=[{"port": 5432}],
         ),
-        opts=provider_args,
+        opts=root_opts,
+    )
+
+    # Create PgBouncer resources. n8n connects through PgBouncer so that its
+    # client connections are pooled onto a small set of server connections.
+    pgbouncer_deployment = Deployment(
+        "pgbouncer-deployment",
+        metadata=meta("pgbouncer"),
+        spec=DeploymentSpecArgs(
+            selector=LabelSelectorArgs(match_labels=pgbouncer_labels),
+            replicas=1,
+            template={
+                "metadata": {"labels": pgbouncer_labels},
+                "spec": {
+                    "containers": [
+                        {
+                            "name": "pgbouncer",
+                            "image": "edoburu/pgbouncer:latest",
+                            "ports": _PGBOUNCER_PORTS,
+                            "envFrom": [
+                                {"secretRef": {"name": POSTGRES_SECRET_NAME}}
+                            ],
+                            "env": [
+                                {
+                                    "name": "DB_HOST",
+                                    "value": postgres_service.metadata["name"],
+                                },
+                                *_PGBOUNCER_ENV,
+                            ],
+                            "resources": _PGBOUNCER_RESOURCES,
+                        }
+                    ],
+                },
+            },
+        ),
+        opts=pulumi.ResourceOptions.merge(
+            root_opts, pulumi.ResourceOptions(depends_on=[postgres_secret])
+        ),
+    )
+
+    pgbouncer_service = Service(
+        "pgbouncer-service",
+        metadata=meta("pgbouncer"),
+        spec=ServiceSpecArgs(
+            selector=pgbouncer_labels,
+            ports=[{"port": 6432}],
+        ),
+        opts=root_opts,
     )
 
     # Create n8n resources
     n8n_secret = Secret(
         "n8n-secret",
-        metadata=ObjectMetaArgs(
-            name="n8n-secret",
-            namespace=namespace_name,
-        ),
-        string_data={
-            "DB_TYPE": "postgresdb",
-            "DB_POSTGRESDB_HOST": postgres_service.metadata["name"],
-            "DB_POSTGRESDB_PORT": "5432",
-            "DB_POSTGRESDB_DATABASE": "n8n",
-            "DB_POSTGRESDB_USER": "postgres",
-            "DB_POSTGRESDB_PASSWORD": postgres_password,
-            "N8N_ENCRYPTION_KEY": n8n_encryption_key,
-            "N8N_JWT_SECRET": n8n_jwt_secret,
+        metadata=meta(N8N_SECRET_NAME),
+        data={
+            key: _b64encode(value)
+            for key, value in {
+                "DB_TYPE": "postgresdb",
+                "DB_POSTGRESDB_HOST": pgbouncer_service.metadata["name"],
+                "DB_POSTGRESDB_PORT": "6432",
+                "DB_POSTGRESDB_HOST_READ": postgres_ro_service.metadata["name"],
+                "DB_POSTGRESDB_DATABASE": "n8n",
+                "DB_POSTGRESDB_USER": "postgres",
+                "DB_POSTGRESDB_PASSWORD": postgres_password,
+                "N8N_ENCRYPTION_KEY": n8n_encryption_key,
+                "N8N_JWT_SECRET": n8n_jwt_secret,
+            }.items()
         },
-        opts=provider_args,
+        opts=root_opts,
     )
 
     n8n_pvc = PersistentVolumeClaim(
         "n8n-pvc",
-        metadata=ObjectMetaArgs(
-            name="n8n-claim0",
-            namespace=namespace_name,
-        ),
+        metadata=meta("n8n-claim0"),
         spec=PersistentVolumeClaimSpecArgs(
             access_modes=["ReadWriteOnce"],
+            storage_class_name="managed-csi",
             resources={"requests": {"storage": "1Gi"}},
         ),
-        opts=provider_args,
+        opts=pvc_opts,
     )
 
     n8n_deployment = Deployment(
         "n8n-deployment",
-        metadata=ObjectMetaArgs(
-            name="n8n",
-            namespace=namespace_name,
-        ),
+        metadata=meta("n8n"),
         spec=DeploymentSpecArgs(
-            selector=LabelSelectorArgs(match_labels={"app": "n8n"}),
+            selector=LabelSelectorArgs(match_labels=n8n_labels),
             replicas=1,
             template={
-                "metadata": {"labels": {"app": "n8n"}},
+                "metadata": {"labels": n8n_labels},
                 "spec": {
                     "containers": [
                         {
                             "name": "n8n",
                             "image": "n8nio/n8n:latest",
-                            "ports": [{"containerPort": 5678}],
-                            "env": [
-                                {
-                                    "name": "DB_TYPE",
-                                    "valueFrom": {
-                                        "secretKeyRef": {
-                                            "name": n8n_secret.metadata["name"],
-                                            "key": "DB_TYPE",
-                                        }
-                                    },
-                                },
-                                {
-                                    "name": "DB_POSTGRESDB_HOST",
-                                    "valueFrom": {
-                                        "secretKeyRef": {
-                                            "name": n8n_secret.metadata["name"],
-                                            "key": "DB_POSTGRESDB_HOST",
-                                        }
-                                    },
-                                },
-                                {
-                                    "name": "DB_POSTGRESDB_PORT",
-                                    "valueFrom": {
-                                        "secretKeyRef": {
-                                            "name": n8n_secret.metadata["name"],
-                                            "key": "DB_POSTGRESDB_PORT",
-                                        }
-                                    },
-                                },
-                                {
-                                    "name": "DB_POSTGRESDB_DATABASE",
-                                    "valueFrom": {
-                                        "secretKeyRef": {
-                                            "name": n8n_secret.metadata["name"],
-                                            "key": "DB_POSTGRESDB_DATABASE",
-                                        }
-                                    },
-                                },
-                                {
-                                    "name": "DB_POSTGRESDB_USER",
-                                    "valueFrom": {
-                                        "secretKeyRef": {
-                                            "name": n8n_secret.metadata["name"],
-                                            "key": "DB_POSTGRESDB_USER",
-                                        }
-                                    },
-                                },
-                                {
-                                    "name": "DB_POSTGRESDB_PASSWORD",
-                                    "valueFrom": {
-                                        "secretKeyRef": {
-                                            "name": n8n_secret.metadata["name"],
-                                            "key": "DB_POSTGRESDB_PASSWORD",
-                                        }
-                                    },
-                                },
-                                {
-                                    "name": "N8N_ENCRYPTION_KEY",
-                                    "valueFrom": {
-                                        "secretKeyRef": {
-                                            "name": n8n_secret.metadata["name"],
-                                            "key": "N8N_ENCRYPTION_KEY",
-                                        }
-                                    },
-                                },
-                                {
-                                    "name": "N8N_JWT_SECRET",
-                                    "valueFrom": {
-                                        "secretKeyRef": {
-                                            "name": n8n_secret.metadata["name"],
-                                            "key": "N8N_JWT_SECRET",
-                                        }
-                                    },
-                                },
+                            "ports": _N8N_PORTS,
+                            "envFrom": [
+                                {"secretRef": {"name": N8N_SECRET_NAME}}
                             ],
-                            "volumeMounts": [
-                                {
-                                    "name": "n8n-data",
-                                    "mountPath": "/home/node/.n8n",
-                                }
-                            ],
-                            "resources": {
-                                "limits": {"memory": "500Mi"},
-                                "requests": {"memory": "250Mi"},
-                            },
+                            "volumeMounts": _N8N_VOLUME_MOUNTS,
+                            "resources": _POD_RESOURCES,
                         }
                     ],
                     "volumes": [
@@ -327,7 +333,9 @@ def deploy_n8n(
                 },
             },
         ),
-        opts=provider_args,
+        opts=pulumi.ResourceOptions.merge(
+            root_opts, pulumi.ResourceOptions(depends_on=[n8n_secret])
+        ),
     )
 
     n8n_service = Service(
@@ -341,21 +349,24 @@ def deploy_n8n(
         ),
         spec=ServiceSpecArgs(
             type="LoadBalancer",
-            selector={"app": "n8n"},
+            selector=n8n_labels,
             ports=[{"port": 80, "targetPort": 5678}],
         ),
-        opts=provider_args,
+        opts=root_opts,
     )
 
     # Extract the service endpoint
-    service_endpoint = pulumi.Output.concat(
-        "http://", n8n_service.status.apply(lambda status: status.load_balancer.ingress[0].ip)
+    service_endpoint = n8n_service.status.apply(
+        lambda status: f"http://{status.load_balancer.ingress[0].ip}"
     )
 
     return N8nDeployment(
         postgres_deployment=postgres_deployment,
         postgres_service=postgres_service,
+        postgres_ro_service=postgres_ro_service,
         postgres_pvc=postgres_pvc,
+        pgbouncer_deployment=pgbouncer_deployment,
+        pgbouncer_service=pgbouncer_service,
         n8n_deployment=n8n_deployment,
         n8n_service=n8n_service,
         n8n_pvc=n8n_pvc,
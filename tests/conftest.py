@@ -4,8 +4,27 @@ Pytest configuration and fixtures for testing n8n Azure deployment.
 import json
 from unittest.mock import MagicMock
 
-import pytest
 import pulumi
+import pytest
+import pytest_asyncio
+
+# Mock state for specific resource types, built once and shared across resources
+_KUBECONFIG_RAW = json.dumps({
+    "apiVersion": "v1",
+    "clusters": [{"cluster": {}, "name": "test-cluster"}],
+    "contexts": [{"context": {}, "name": "test-context"}],
+    "current-context": "test-context",
+    "kind": "Config",
+    "users": [{"name": "test-user", "user": {}}],
+})
+_MC_UPDATE = {"kubeConfigRaw": _KUBECONFIG_RAW}
+_SVC_UPDATE = {
+    "status": {
+        "loadBalancer": {
+            "ingress": [{"ip": "10.0.0.1"}]
+        }
+    }
+}
 
 
 # Set up mocks for Pulumi to allow testing without actually creating resources
@@ -14,39 +33,31 @@ class PulumiMocks(pulumi.runtime.Mocks):
     Mocks for Pulumi to test infrastructure code without creating real resources.
     """
 
+    def __init__(self):
+        super().__init__()
+        # Inputs of every registered resource, keyed by resource name
+        self.inputs = {}
+
     def new_resource(self, args: pulumi.runtime.MockResourceArgs):
         """
         Create a mock resource and return predefined outputs.
         """
+        self.inputs[args.name] = args.inputs
+
         # Return consistent resource IDs to ensure tests are deterministic
         resource_id = f"{args.name}_id"
         state = {
             "id": resource_id,
             # Add any other default properties needed for your resources
             "name": args.name,
-            "urn": f"urn:pulumi:{args.stack}::{args.type}::{args.name}",
+            "urn": f"urn:pulumi:{pulumi.get_stack()}::{args.typ}::{args.name}",
         }
 
         # Customize outputs for specific resource types
-        if args.type == "azure-native:containerservice:ManagedCluster":
-            state.update({
-                "kubeConfigRaw": json.dumps({
-                    "apiVersion": "v1",
-                    "clusters": [{"cluster": {}, "name": "test-cluster"}],
-                    "contexts": [{"context": {}, "name": "test-context"}],
-                    "current-context": "test-context",
-                    "kind": "Config",
-                    "users": [{"name": "test-user", "user": {}}],
-                }),
-            })
-        elif args.type == "kubernetes:core/v1:Service" and args.name == "n8n-service":
-            state.update({
-                "status": {
-                    "loadBalancer": {
-                        "ingress": [{"ip": "10.0.0.1"}]
-                    }
-                }
-            })
+        if args.typ == "azure-native:containerservice:ManagedCluster":
+            state.update(_MC_UPDATE)
+        elif args.typ == "kubernetes:core/v1:Service" and args.name == "n8n-service":
+            state.update(_SVC_UPDATE)
 
         return resource_id, dict(args.inputs, **state)
 
@@ -55,7 +66,7 @@ class PulumiMocks(pulumi.runtime.Mocks):
         Mock resource calls during testing.
         """
         # Handle specific calls
-        if args.token == "azure-native:containerservice:getManagedClusterAdminCredentials":
+        if args.token == "azure-native:containerservice:listManagedClusterAdminCredentials":
             return {
                 "kubeconfigs": [
                     {
@@ -68,15 +79,19 @@ class PulumiMocks(pulumi.runtime.Mocks):
         return {}
 
 
-@pytest.fixture(scope="session", autouse=True)
-def setup_pulumi_mocks():
+@pytest_asyncio.fixture(scope="session", loop_scope="session", autouse=True)
+async def setup_pulumi_mocks():
     """
     Set up Pulumi mocks for all tests.
     
-    This fixture runs once at the start of the test session and configures
-    Pulumi to use our mocks instead of interacting with real cloud providers.
+    This fixture runs once at the start of the test session, on the shared
+    session event loop, and configures Pulumi to use our mocks instead of
+    interacting with real cloud providers. Tests can request it to inspect
+    the inputs resources were registered with.
     """
-    pulumi.runtime.set_mocks(PulumiMocks())
+    mocks = PulumiMocks()
+    pulumi.runtime.set_mocks(mocks)
+    return mocks
 
 
 @pytest.fixture
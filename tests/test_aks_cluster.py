@@ -1,6 +1,7 @@
 """
 Tests for the AKS cluster module.
 """
+
 import pulumi
 import pytest
 from pulumi_azure_native import containerservice, resources
@@ -9,63 +10,91 @@ from pu_py_n8n.aks_cluster import create_aks_cluster
 
 
 @pytest.mark.asyncio
-async def test_resource_group_creation():
-    """Test that the resource group is created with the correct properties."""
-    
-    def check_resource_group(args):
-        resource_group = args[0]
-        assert resource_group.resource_group_name == "test-resource-group"
-        assert resource_group.location == "eastus"
-        return True
+async def test_cluster_uses_resource_group(setup_pulumi_mocks):
+    """Test that the cluster is created in the resource group it is given."""
+
+    resource_group = resources.ResourceGroup(
+        "shared-resource-group",
+        resource_group_name="shared-resource-group",
+        location="westeurope",
+    )
 
-    # Set up a resource check to validate properties
-    resource_check = pulumi.runtime.ResourceCheck()
-    resource_check.register("azure-native:resources:ResourceGroup", check_resource_group)
-    
     # Create the AKS cluster
     cluster = create_aks_cluster(
-        resource_group_name="test-resource-group",
-        location="eastus",
+        resource_group=resource_group,
+        cluster_name="shared-resource-group-aks",
         kubernetes_version="1.26.10",
         node_count=1,
         node_size="Standard_D2_v2",
     )
-    
-    # Wait for the resource check to complete
-    await resource_check.wait()
-    
-    # Verify the cluster was created and has the expected properties
-    assert cluster.name is not None
-    assert cluster.resource_group is not None
-    assert cluster.kubeconfig is not None
+
+    # The cluster keeps the group it was given rather than creating its own
+    assert cluster.resource_group is resource_group
+
+    # The managed cluster takes its location and resource group from the group
+    assert await cluster.cluster.location.future() == "westeurope"
+    inputs = setup_pulumi_mocks.inputs["shared-resource-group-aks"]
+    assert inputs["resourceGroupName"] == "shared-resource-group"
+    assert inputs["location"] == "westeurope"
 
 
 @pytest.mark.asyncio
 async def test_aks_cluster_configuration():
     """Test that the AKS cluster is configured with the correct properties."""
-    
+
     def check_aks_cluster(args):
-        cluster = args[0]
-        assert cluster.kubernetes_version == "1.26.10"
-        assert len(cluster.agent_pool_profiles) == 1
-        assert cluster.agent_pool_profiles[0].count == 1
-        assert cluster.agent_pool_profiles[0].vm_size == "Standard_D2_v2"
-        assert cluster.agent_pool_profiles[0].mode == "System"
-        assert cluster.enable_rbac is True
+        kubernetes_version, agent_pool_profiles, enable_rbac = args
+        assert kubernetes_version == "1.26.10"
+        assert len(agent_pool_profiles) == 1
+        assert agent_pool_profiles[0]["count"] == 1
+        assert agent_pool_profiles[0]["vm_size"] == "Standard_D2_v2"
+        assert agent_pool_profiles[0]["mode"] == "System"
+        assert enable_rbac is True
         return True
-    
-    # Set up a resource check to validate properties
-    resource_check = pulumi.runtime.ResourceCheck()
-    resource_check.register("azure-native:containerservice:ManagedCluster", check_aks_cluster)
-    
+
     # Create the AKS cluster
     cluster = create_aks_cluster(
-        resource_group_name="test-resource-group",
-        location="eastus",
+        resource_group=resources.ResourceGroup(
+            "test-resource-group",
+            resource_group_name="test-resource-group",
+            location="eastus",
+        ),
+        cluster_name="test-resource-group-aks",
         kubernetes_version="1.26.10",
         node_count=1,
         node_size="Standard_D2_v2",
     )
-    
-    # Wait for the resource check to complete
-    await resource_check.wait()
\ No newline at end of file
+
+    # Check the managed cluster once its outputs resolve
+    managed_cluster = cluster.cluster
+    assert (
+        await pulumi.Output.all(
+            managed_cluster.kubernetes_version,
+            managed_cluster.agent_pool_profiles,
+            managed_cluster.enable_rbac,
+        )
+        .apply(check_aks_cluster)
+        .future()
+    )
+
+
+@pytest.mark.asyncio
+async def test_kubeconfig_is_secret():
+    """Test that the cluster kubeconfig is decoded and marked as a secret."""
+
+    # Create the AKS cluster
+    cluster = create_aks_cluster(
+        resource_group=resources.ResourceGroup(
+            "test-resource-group",
+            resource_group_name="test-resource-group",
+            location="eastus",
+        ),
+        cluster_name="test-resource-group-aks",
+        kubernetes_version="1.26.10",
+        node_count=1,
+        node_size="Standard_D2_v2",
+    )
+
+    assert await cluster.kubeconfig.is_secret()
+    # The mocked credentials carry base64 of "apiVersion: v1\n"
+    assert await cluster.kubeconfig.future() == "apiVersion: v1\n"
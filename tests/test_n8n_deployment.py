@@ -1,6 +1,9 @@
 """
 Tests for the n8n deployment module.
 """
+
+import base64
+
 import pulumi
 import pytest
 from pulumi_kubernetes.apps.v1 import Deployment
@@ -9,10 +12,16 @@ from pulumi_kubernetes.core.v1 import PersistentVolumeClaim, Secret, Service
 from pu_py_n8n.n8n_deployment import deploy_n8n
 
 
+def _secret_data(mocks, name):
+    """Return the base64-decoded data a mocked Secret was registered with."""
+    data = pulumi.runtime.rpc.unwrap_rpc_secret(mocks.inputs[name]["data"])
+    return {key: base64.b64decode(value).decode() for key, value in data.items()}
+
+
 @pytest.mark.asyncio
 async def test_n8n_deployment_creates_resources(aks_cluster_mock):
     """Test that the n8n deployment creates all required resources."""
-    
+
     # Deploy n8n with test credentials
     deployment = deploy_n8n(
         aks_cluster=aks_cluster_mock,
@@ -20,11 +29,14 @@ async def test_n8n_deployment_creates_resources(aks_cluster_mock):
         n8n_encryption_key="test-n8n-encryption-key",
         n8n_jwt_secret="test-n8n-jwt-secret",
     )
-    
+
     # Verify all expected resources are created
     assert isinstance(deployment.postgres_deployment, Deployment)
     assert isinstance(deployment.postgres_service, Service)
+    assert isinstance(deployment.postgres_ro_service, Service)
     assert isinstance(deployment.postgres_pvc, PersistentVolumeClaim)
+    assert isinstance(deployment.pgbouncer_deployment, Deployment)
+    assert isinstance(deployment.pgbouncer_service, Service)
     assert isinstance(deployment.n8n_deployment, Deployment)
     assert isinstance(deployment.n8n_service, Service)
     assert isinstance(deployment.n8n_pvc, PersistentVolumeClaim)
@@ -32,109 +44,247 @@ async def test_n8n_deployment_creates_resources(aks_cluster_mock):
 
 
 @pytest.mark.asyncio
-async def test_postgres_configuration():
+async def test_postgres_configuration(setup_pulumi_mocks, aks_cluster_mock):
     """Test that PostgreSQL is configured correctly."""
-    
+
     def check_postgres_deployment(args):
-        deployment = args[0]
-        spec = deployment.spec
-        
+        spec, metadata = args
+        assert metadata["name"] == "postgres"
+
         # Check replicas
-        assert spec.replicas == 1
-        
+        assert spec["replicas"] == 1
+
         # Check container image
-        containers = spec.template["spec"]["containers"]
+        containers = spec["template"]["spec"]["containers"]
         assert len(containers) == 1
         assert containers[0]["image"] == "postgres:14"
-        
+
         # Check port
-        assert containers[0]["ports"][0]["containerPort"] == 5432
-        
+        assert containers[0]["ports"][0]["container_port"] == 5432
+
         # Check resource limits
         assert containers[0]["resources"]["limits"]["memory"] == "500Mi"
         assert containers[0]["resources"]["requests"]["memory"] == "250Mi"
-        
+
+        return True
+
+    # Deploy n8n with test credentials
+    deployment = deploy_n8n(
+        aks_cluster=aks_cluster_mock,
+        postgres_password="test-postgres-password",
+        n8n_encryption_key="test-n8n-encryption-key",
+        n8n_jwt_secret="test-n8n-jwt-secret",
+    )
+
+    # Check the PostgreSQL deployment once its outputs resolve
+    postgres = deployment.postgres_deployment
+    assert (
+        await pulumi.Output.all(postgres.spec, postgres.metadata)
+        .apply(check_postgres_deployment)
+        .future()
+    )
+
+    # The container's variables come from the keys of the secret it loads
+    await postgres.urn.future()
+    assert set(_secret_data(setup_pulumi_mocks, "postgres-secret")) == {
+        "POSTGRES_PASSWORD",
+        "POSTGRES_USER",
+        "POSTGRES_DB",
+    }
+
+
+@pytest.mark.asyncio
+async def test_postgres_ro_service(setup_pulumi_mocks, aks_cluster_mock):
+    """Test that the read-only service targets future replicas only."""
+
+    # Deploy n8n with test credentials
+    deployment = deploy_n8n(
+        aks_cluster=aks_cluster_mock,
+        postgres_password="test-postgres-password",
+        n8n_encryption_key="test-n8n-encryption-key",
+        n8n_jwt_secret="test-n8n-jwt-secret",
+    )
+
+    # The selector matches replica pods, never the primary labelled app=postgres
+    service = deployment.postgres_ro_service
+    spec, metadata = await pulumi.Output.all(service.spec, service.metadata).future()
+    assert metadata["name"] == "postgres-ro"
+    assert spec["selector"] == {"app": "postgres-replica"}
+    assert spec["ports"][0]["port"] == 5432
+
+    # n8n is given the read-only host for future read routing
+    await deployment.n8n_deployment.urn.future()
+    n8n_secret = _secret_data(setup_pulumi_mocks, "n8n-secret")
+    assert n8n_secret["DB_POSTGRESDB_HOST_READ"] == "postgres-ro"
+
+
+@pytest.mark.asyncio
+async def test_pgbouncer_configuration(setup_pulumi_mocks, aks_cluster_mock):
+    """Test that PgBouncer pools connections to PostgreSQL."""
+
+    def check_pgbouncer_deployment(args):
+        spec, metadata = args
+        assert metadata["name"] == "pgbouncer"
+
+        # Check container image
+        containers = spec["template"]["spec"]["containers"]
+        assert len(containers) == 1
+        assert containers[0]["image"] == "edoburu/pgbouncer:latest"
+
+        # Check port
+        assert containers[0]["ports"][0]["container_port"] == 6432
+
+        # Check upstream credentials come from the postgres secret
+        env_from = containers[0]["env_from"]
+        assert len(env_from) == 1
+        assert env_from[0]["secret_ref"]["name"] == "postgres-secret"
+
+        # Check pooling settings
+        env = {var["name"]: var["value"] for var in containers[0]["env"]}
+        assert env["DB_HOST"] == "postgres"
+        assert env["DB_PORT"] == "5432"
+        assert env["DB_USER"] == "$(POSTGRES_USER)"
+        assert env["DB_PASSWORD"] == "$(POSTGRES_PASSWORD)"
+        assert env["DB_NAME"] == "$(POSTGRES_DB)"
+        assert env["LISTEN_PORT"] == "6432"
+        assert env["POOL_MODE"] == "transaction"
+        assert env["MAX_CLIENT_CONN"] == "10000"
+        assert env["DEFAULT_POOL_SIZE"] == "20"
+
+        # Check resource limits
+        assert containers[0]["resources"]["limits"]["memory"] == "128Mi"
+        assert containers[0]["resources"]["requests"]["memory"] == "64Mi"
+
         return True
-    
-    # Set up a resource check
-    resource_check = pulumi.runtime.ResourceCheck()
-    resource_check.register("kubernetes:apps/v1:Deployment", check_postgres_deployment, 
-                            lambda args: args[0].metadata["name"] == "postgres")
-    
+
     # Deploy n8n with test credentials
-    deploy_n8n(
+    deployment = deploy_n8n(
         aks_cluster=aks_cluster_mock,
         postgres_password="test-postgres-password",
         n8n_encryption_key="test-n8n-encryption-key",
         n8n_jwt_secret="test-n8n-jwt-secret",
     )
-    
-    # Wait for the resource check to complete
-    await resource_check.wait()
+
+    # Check the PgBouncer deployment once its outputs resolve
+    pgbouncer = deployment.pgbouncer_deployment
+    assert (
+        await pulumi.Output.all(pgbouncer.spec, pgbouncer.metadata)
+        .apply(check_pgbouncer_deployment)
+        .future()
+    )
+
+    # Check the PgBouncer service exposes the pooler port to n8n
+    service = deployment.pgbouncer_service
+    spec, metadata = await pulumi.Output.all(service.spec, service.metadata).future()
+    assert metadata["name"] == "pgbouncer"
+    assert spec["selector"] == {"app": "pgbouncer"}
+    assert spec["ports"][0]["port"] == 6432
+
+    # n8n connects to PgBouncer rather than to PostgreSQL directly
+    await deployment.n8n_deployment.urn.future()
+    n8n_secret = _secret_data(setup_pulumi_mocks, "n8n-secret")
+    assert n8n_secret["DB_POSTGRESDB_HOST"] == "pgbouncer"
+    assert n8n_secret["DB_POSTGRESDB_PORT"] == "6432"
 
 
 @pytest.mark.asyncio
-async def test_n8n_configuration():
+async def test_n8n_configuration(setup_pulumi_mocks, aks_cluster_mock):
     """Test that n8n is configured correctly."""
-    
+
     def check_n8n_deployment(args):
-        deployment = args[0]
-        spec = deployment.spec
-        
+        spec, metadata = args
+        assert metadata["name"] == "n8n"
+
         # Check replicas
-        assert spec.replicas == 1
-        
+        assert spec["replicas"] == 1
+
         # Check container image
-        containers = spec.template["spec"]["containers"]
+        containers = spec["template"]["spec"]["containers"]
         assert len(containers) == 1
         assert containers[0]["image"] == "n8nio/n8n:latest"
-        
+
         # Check port
-        assert containers[0]["ports"][0]["containerPort"] == 5678
-        
+        assert containers[0]["ports"][0]["container_port"] == 5678
+
         # Check resource limits
         assert containers[0]["resources"]["limits"]["memory"] == "500Mi"
         assert containers[0]["resources"]["requests"]["memory"] == "250Mi"
-        
-        # Check environment variables exist (we can't check values directly because they're from secrets)
-        env_names = [env["name"] for env in containers[0]["env"]]
-        required_env_vars = [
-            "DB_TYPE", 
-            "DB_POSTGRESDB_HOST", 
-            "DB_POSTGRESDB_PORT",
-            "DB_POSTGRESDB_DATABASE", 
-            "DB_POSTGRESDB_USER", 
-            "DB_POSTGRESDB_PASSWORD",
-            "N8N_ENCRYPTION_KEY",
-            "N8N_JWT_SECRET"
-        ]
-        
-        for env_var in required_env_vars:
-            assert env_var in env_names
-        
+
+        # Check environment variables are sourced from the n8n secret
+        env_from = containers[0]["env_from"]
+        assert len(env_from) == 1
+        assert env_from[0]["secret_ref"]["name"] == "n8n-secret"
+
         return True
-    
-    # Set up a resource check
-    resource_check = pulumi.runtime.ResourceCheck()
-    resource_check.register("kubernetes:apps/v1:Deployment", check_n8n_deployment, 
-                            lambda args: args[0].metadata["name"] == "n8n")
-    
+
     # Deploy n8n with test credentials
-    deploy_n8n(
+    deployment = deploy_n8n(
         aks_cluster=aks_cluster_mock,
         postgres_password="test-postgres-password",
         n8n_encryption_key="test-n8n-encryption-key",
         n8n_jwt_secret="test-n8n-jwt-secret",
     )
-    
-    # Wait for the resource check to complete
-    await resource_check.wait()
+
+    # Check the n8n deployment once its outputs resolve
+    n8n = deployment.n8n_deployment
+    assert (
+        await pulumi.Output.all(n8n.spec, n8n.metadata)
+        .apply(check_n8n_deployment)
+        .future()
+    )
+
+    # The container's variables come from the keys of the secret it loads
+    await n8n.urn.future()
+    assert set(_secret_data(setup_pulumi_mocks, "n8n-secret")) == {
+        "DB_TYPE",
+        "DB_POSTGRESDB_HOST",
+        "DB_POSTGRESDB_HOST_READ",
+        "DB_POSTGRESDB_PORT",
+        "DB_POSTGRESDB_DATABASE",
+        "DB_POSTGRESDB_USER",
+        "DB_POSTGRESDB_PASSWORD",
+        "N8N_ENCRYPTION_KEY",
+        "N8N_JWT_SECRET",
+    }
+
+
+@pytest.mark.asyncio
+async def test_secret_data_is_base64_encoded(setup_pulumi_mocks, aks_cluster_mock):
+    """Test that secret data decodes back to the plaintext values."""
+
+    # Deploy n8n with credentials containing URL-reserved characters
+    deployment = deploy_n8n(
+        aks_cluster=aks_cluster_mock,
+        postgres_password="p@ss:w/rd",
+        n8n_encryption_key="test-n8n-encryption-key",
+        n8n_jwt_secret="test-n8n-jwt-secret",
+    )
+    await deployment.postgres_deployment.urn.future()
+    await deployment.n8n_deployment.urn.future()
+
+    assert _secret_data(setup_pulumi_mocks, "postgres-secret") == {
+        "POSTGRES_PASSWORD": "p@ss:w/rd",
+        "POSTGRES_USER": "postgres",
+        "POSTGRES_DB": "n8n",
+    }
+    # The host entries are Outputs and are encoded once they resolve
+    assert _secret_data(setup_pulumi_mocks, "n8n-secret") == {
+        "DB_TYPE": "postgresdb",
+        "DB_POSTGRESDB_HOST": "pgbouncer",
+        "DB_POSTGRESDB_PORT": "6432",
+        "DB_POSTGRESDB_HOST_READ": "postgres-ro",
+        "DB_POSTGRESDB_DATABASE": "n8n",
+        "DB_POSTGRESDB_USER": "postgres",
+        "DB_POSTGRESDB_PASSWORD": "p@ss:w/rd",
+        "N8N_ENCRYPTION_KEY": "test-n8n-encryption-key",
+        "N8N_JWT_SECRET": "test-n8n-jwt-secret",
+    }
 
 
 @pytest.mark.asyncio
-async def test_service_endpoint():
+async def test_service_endpoint(aks_cluster_mock):
     """Test that the service endpoint is properly constructed."""
-    
+
     # Deploy n8n with test credentials
     deployment = deploy_n8n(
         aks_cluster=aks_cluster_mock,
@@ -142,10 +292,10 @@ async def test_service_endpoint():
         n8n_encryption_key="test-n8n-encryption-key",
         n8n_jwt_secret="test-n8n-jwt-secret",
     )
-    
+
     # Get the service endpoint
     endpoint = await deployment.service_endpoint.future()
-    
+
     # Verify it's correctly formed
     assert endpoint.startswith("http://")
-    assert "10.0.0.1" in endpoint  # This is the IP we set in the mock
\ No newline at end of file
+    assert "10.0.0.1" in endpoint  # This is the IP we set in the mock